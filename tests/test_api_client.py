@@ -16,9 +16,14 @@
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
+import asyncio
 import pytest
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from tiny_api_client import api_client, get, post, put, patch, delete
+from tiny_api_client import gather_many
 from tiny_api_client import APIEmptyResponseError, APIStatusError
 
 
@@ -147,7 +152,7 @@ def test_non_json(mocker, example_url):
 def test_non_json_xml(mocker, example_url):
     mock_requests = mocker.patch('tiny_api_client.requests')
     mock_response = mocker.Mock()
-    mock_response.text = """
+    mock_response.content = b"""
     <song>
         <title>First</title>
     </song>
@@ -389,3 +394,509 @@ def test_session_member(mock_requests, example_url, example_note):
         'GET', f'{example_url}/my-endpoint', timeout=None,
         cookies=example_session
     )
+
+
+def test_session_per_instance(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    mock_requests.Session.reset_mock()
+    client = MyClient()
+    client.get_my_endpoint()
+    client.get_my_endpoint()
+    mock_requests.Session.assert_called_once_with()
+
+
+def test_escaped_route_braces(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{{literal}}')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint()
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f'{example_url}/my-endpoint/{{literal}}', timeout=None, cookies=None
+    )
+
+
+def test_session_member_warns_once(mock_requests, example_url, caplog):
+    @api_client(example_url)
+    class MyClient:
+        def __init__(self, session: dict[str, str]):
+            self._session = session
+
+        @get('/my-endpoint')
+        def fetch_my_endpoint(self, response):
+            return response
+
+    client = MyClient({'session_cookie': 'MY_COOKIE'})
+    client.fetch_my_endpoint()
+    client.fetch_my_endpoint()
+    MyClient({'session_cookie': 'OTHER_COOKIE'}).fetch_my_endpoint()
+    assert caplog.text.count('_session is deprecated') == 1
+
+
+def test_session_member_set_after_init_warns(mock_requests, example_url,
+                                             caplog):
+    @api_client(example_url)
+    class MyClient:
+        def login(self, session: dict[str, str]):
+            self._session = session
+
+        @get('/my-endpoint')
+        def fetch_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    assert '_session is deprecated' not in caplog.text
+    client.login({'session_cookie': 'MY_COOKIE'})
+    client.fetch_my_endpoint()
+    assert caplog.text.count('_session is deprecated') == 1
+
+
+def test_partial_route_parameters(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{first_id}/child/{second_id}')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint(first_id='1')
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f'{example_url}/my-endpoint/1/child', timeout=None, cookies=None
+    )
+
+    client.get_my_endpoint()
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f'{example_url}/my-endpoint//child', timeout=None, cookies=None
+    )
+
+
+def test_class_decorator_parameter_status_handler_args(mocker, mock_requests,
+                                                       example_url, example_note):
+    handler = mocker.Mock()
+
+    @api_client(example_url, status_key='custom_error',
+                status_handler=handler)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint()
+    handler.assert_called_once_with(client, '200', example_note)
+
+
+def test_list_response(mocker, example_url):
+    mock_requests = mocker.patch('tiny_api_client.requests')
+    mock_response = mocker.Mock()
+    mock_response.json.return_value = ['status', 'results']
+
+    get_request_fn(mock_requests).return_value = mock_response
+
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    assert client.get_my_endpoint() == ['status', 'results']
+
+
+def test_non_json_xml_encoding(mocker, example_url):
+    mock_requests = mocker.patch('tiny_api_client.requests')
+    mock_response = mocker.Mock()
+    mock_response.content = (
+        '<?xml version="1.0" encoding="ISO-8859-1"?>'
+        '<song><title>Canción</title></song>'
+    ).encode('iso-8859-1')
+
+    get_request_fn(mock_requests).return_value = mock_response
+
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint', json=False, xml=True)
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    root = client.get_my_endpoint()
+    assert root.find('title').text == 'Canción'
+
+
+def test_external_url(mock_requests, example_url):
+    @api_client(f"{example_url}/v{{version}}")
+    class MyClient:
+        @get('{external_url}', use_api=False)
+        def get_external(self, response):
+            return response
+
+    client = MyClient()
+    client.get_external(external_url='https://example.com/resource/')
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', 'https://example.com/resource', timeout=None, cookies=None
+    )
+
+
+def test_class_decorator_parameter_connections(mock_requests, example_url):
+    @api_client(example_url, max_retries=3,
+                pool_connections=2, pool_maxsize=5, pool_block=True)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint()
+    adapter = mock_requests.adapters.HTTPAdapter
+    adapter.assert_called_once_with(
+        pool_connections=2, pool_maxsize=5, pool_block=True, max_retries=3
+    )
+    mock_requests.Session().mount.assert_any_call(
+        'https://', adapter.return_value
+    )
+
+
+def test_class_decorator_parameter_json_loader(mocker, example_url):
+    mock_requests = mocker.patch('tiny_api_client.requests')
+    mock_response = mocker.Mock()
+    mock_response.content = b'{"results": [1, 2, 3]}'
+
+    get_request_fn(mock_requests).return_value = mock_response
+    json_loader = mocker.Mock(return_value={'results': [1, 2, 3]})
+
+    @api_client(example_url, json_loader=json_loader)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    assert client.get_my_endpoint() == [1, 2, 3]
+    json_loader.assert_called_once_with(b'{"results": [1, 2, 3]}')
+    mock_response.json.assert_not_called()
+
+
+def test_async_endpoint(mock_requests, example_url, example_note):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{item_id}')
+        async def get_my_endpoint(self, response, suffix):
+            return response, suffix
+
+    client = MyClient()
+    r = asyncio.run(client.get_my_endpoint('!', item_id='1'))
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f'{example_url}/my-endpoint/1', timeout=None, cookies=None
+    )
+    assert r == (example_note, '!')
+
+
+def test_async_endpoint_serializes_session(mock_requests, example_url,
+                                           example_note):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint')
+        async def get_my_endpoint(self, response):
+            return response
+
+    in_flight = []
+    overlapped = []
+
+    def request(*args, **kwargs):
+        in_flight.append(None)
+        overlapped.append(len(in_flight) > 1)
+        time.sleep(0.01)
+        in_flight.pop()
+        return mock_requests.Session().request.return_value
+
+    get_request_fn(mock_requests).side_effect = request
+    client = MyClient()
+
+    async def main():
+        return await asyncio.gather(*(client.get_my_endpoint()
+                                      for _ in range(4)))
+
+    assert asyncio.run(main()) == [example_note] * 4
+    assert len(overlapped) == 4
+    assert not any(overlapped)
+
+
+def test_gather_many(mock_requests, example_url, example_note):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{item_id}')
+        async def get_my_endpoint(self, response):
+            return response
+
+    calls = (MyClient().get_my_endpoint(item_id=str(i)) for i in range(5))
+    r = asyncio.run(gather_many(calls, concurrency=2))
+    assert r == [example_note] * 5
+    assert get_request_fn(mock_requests).call_count == 5
+
+
+def test_gather_many_invalid_concurrency():
+    with pytest.raises(ValueError):
+        asyncio.run(gather_many([], concurrency=0))
+
+
+def test_shared_connection_pool(mocker, mock_requests, example_url):
+    sessions = [mocker.Mock(), mocker.Mock()]
+    mock_requests.Session.side_effect = sessions
+
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    MyClient()
+    MyClient()
+    adapter = mock_requests.adapters.HTTPAdapter
+    adapter.assert_called_once()
+    for session in sessions:
+        session.mount.assert_any_call('https://', adapter.return_value)
+
+
+def test_response_cache(mock_requests, example_url, example_note):
+    cache = {}
+
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{item_id}', cache=cache)
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    request_fn = get_request_fn(mock_requests)
+    request_fn.reset_mock()
+
+    assert client.get_my_endpoint(item_id='1') == example_note
+    assert client.get_my_endpoint(item_id='1') == example_note
+    assert request_fn.call_count == 1
+
+    client.get_my_endpoint(item_id='2')
+    client.get_my_endpoint(item_id='2', params={'page': 2})
+    assert request_fn.call_count == 3
+    assert len(cache) == 2
+
+
+def test_response_cache_shared_by_endpoints(mock_requests, example_url,
+                                            example_note):
+    cache = {}
+
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint', cache=cache, params={'expand': 'all'})
+        def get_my_endpoint(self, response):
+            return response
+
+        @get('/my-endpoint', cache=cache, json=False)
+        def get_my_raw_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    request_fn = get_request_fn(mock_requests)
+    request_fn.reset_mock()
+
+    assert client.get_my_endpoint() == example_note
+    assert client.get_my_raw_endpoint() is request_fn.return_value
+    assert request_fn.call_count == 2
+    assert len(cache) == 2
+
+
+def test_response_cache_skips_errors(mocker, example_url):
+    mock_requests = mocker.patch('tiny_api_client.requests')
+    mock_response = mocker.Mock()
+    get_request_fn(mock_requests).return_value = mock_response
+    cache = {}
+
+    @api_client(example_url, status_handler=lambda *args: None)
+    class MyClient:
+        @get('/my-endpoint', cache=cache)
+        def get_my_endpoint(self, response):
+            return response
+
+        @get('/my-raw-endpoint', json=False, cache=cache)
+        def get_my_raw_endpoint(self, response):
+            return response
+
+    client = MyClient()
+
+    # Non-2xx response
+    mock_response.ok = False
+    mock_response.json.return_value = {'results': 'oops'}
+    client.get_my_endpoint()
+    client.get_my_raw_endpoint()
+
+    # Successful response with a status handled by the status handler
+    mock_response.ok = True
+    mock_response.json.return_value = {'status': 'oops'}
+    client.get_my_endpoint()
+
+    assert cache == {}
+
+
+def test_class_decorator_parameter_xml_loader(mocker, example_url):
+    mock_requests = mocker.patch('tiny_api_client.requests')
+    mock_response = mocker.Mock()
+    mock_response.content = b'<song><title>First</title></song>'
+
+    get_request_fn(mock_requests).return_value = mock_response
+    xml_loader = mocker.Mock()
+
+    @api_client(example_url, xml_loader=xml_loader)
+    class MyClient:
+        @get('/my-endpoint', json=False, xml=True)
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    assert client.get_my_endpoint() == xml_loader.return_value
+    xml_loader.assert_called_once_with(b'<song><title>First</title></song>')
+
+
+def test_default_retries(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    adapter_kwargs = mock_requests.adapters.HTTPAdapter.call_args.kwargs
+    retry = adapter_kwargs['max_retries']
+    assert 429 in retry.status_forcelist
+    assert retry.respect_retry_after_header
+    assert retry.total == 3
+    assert retry.backoff_max == 2
+    assert 'GET' in retry.allowed_methods
+    assert 'POST' not in retry.allowed_methods
+
+
+@pytest.fixture
+def flaky_server():
+    """Local server which fails a number of requests before succeeding"""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        failures = 0
+        status = 503
+        retry_after = None
+
+        def do_GET(self):
+            requests_seen.append(self.path)
+            if len(requests_seen) <= Handler.failures:
+                self.send_response(Handler.status)
+                if Handler.retry_after is not None:
+                    self.send_header('Retry-After', Handler.retry_after)
+                body = b'{"error": "unavailable"}'
+            else:
+                self.send_response(200)
+                body = b'{"results": "ok"}'
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', Handler, requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def flaky_client(flaky_server):
+    url, _, _ = flaky_server
+
+    @api_client(url)
+    class MyClient:
+        @get('/my-endpoint')
+        def get_my_endpoint(self, response):
+            return response
+
+    return MyClient()
+
+
+def test_default_retries_recover(flaky_server, flaky_client):
+    _, handler, requests_seen = flaky_server
+    handler.failures = 2
+
+    assert flaky_client.get_my_endpoint() == 'ok'
+    assert len(requests_seen) == 3
+
+
+def test_default_retries_give_up_quickly(flaky_server, flaky_client):
+    _, handler, requests_seen = flaky_server
+    handler.failures = 100
+
+    start = time.monotonic()
+    # The error response is returned once retries are exhausted
+    assert flaky_client.get_my_endpoint() == {'error': 'unavailable'}
+    assert time.monotonic() - start < 10
+    assert len(requests_seen) == 4
+
+
+def test_default_retries_follow_short_retry_after(flaky_server, flaky_client):
+    _, handler, requests_seen = flaky_server
+    handler.failures = 1
+    handler.status = 429
+    handler.retry_after = '1'
+
+    start = time.monotonic()
+    assert flaky_client.get_my_endpoint() == 'ok'
+    assert time.monotonic() - start >= 1
+    assert len(requests_seen) == 2
+
+
+def test_default_retries_stop_on_long_retry_after(flaky_server, flaky_client):
+    _, handler, requests_seen = flaky_server
+    handler.failures = 100
+    handler.status = 429
+    handler.retry_after = '60'
+
+    start = time.monotonic()
+    # The server asked for a longer wait than allowed, so no retries
+    assert flaky_client.get_my_endpoint() == {'error': 'unavailable'}
+    assert time.monotonic() - start < 1
+    assert len(requests_seen) == 1
+
+
+def test_repeated_route_parameter(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{item_id}/copy/{item_id}')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint(item_id='1')
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f'{example_url}/my-endpoint/1/copy/1', timeout=None, cookies=None
+    )
+
+
+def test_route_parameter_conversion(mock_requests, example_url):
+    @api_client(example_url)
+    class MyClient:
+        @get('/my-endpoint/{item_id!r}/{name!a:>8}')
+        def get_my_endpoint(self, response):
+            return response
+
+    client = MyClient()
+    client.get_my_endpoint(item_id='1', name='é')
+    get_request_fn(mock_requests).assert_called_with(
+        'GET', f"{example_url}/my-endpoint/'1'/  '\\xe9'",
+        timeout=None, cookies=None
+    )
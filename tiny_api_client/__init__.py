@@ -32,17 +32,27 @@ Basic usage:
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301  USA
 
+import asyncio
+import inspect
 import logging
 import requests
 import string
-from collections import defaultdict
-from collections.abc import Callable
-from dataclasses import dataclass
+import threading
+from collections.abc import Awaitable, Callable, Iterable, MutableMapping
+from dataclasses import dataclass, field
 from functools import wraps
-from typing import Any, Concatenate, ParamSpec, Protocol, TypeVar
+from types import TracebackType
+from typing import Any, Concatenate, Literal, ParamSpec, Protocol, TypeVar
+from typing import cast, overload
+from typing_extensions import Self
+from urllib3.connectionpool import ConnectionPool
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.response import BaseHTTPResponse
+from urllib3.util import Retry
 from xml.etree import ElementTree
 
-__all__ = ['api_client', 'get', 'post', 'put', 'patch', 'delete']
+__all__ = ['api_client', 'get', 'post', 'put', 'patch', 'delete',
+           'gather_many']
 
 _logger = logging.getLogger(__name__)
 _logger.addHandler(logging.NullHandler())
@@ -53,7 +63,9 @@ P = ParamSpec('P')
 T = TypeVar('T')
 
 APIStatusHandler = Callable[[Any, Any, Any], None] | None
-_StatusHandler = Callable[[Any, Any], None] | None
+JSONLoader = Callable[[bytes], Any] | None
+XMLLoader = Callable[[bytes], Any] | None
+APICache = MutableMapping[Any, Any] | None
 
 APIClient = TypeVar('APIClient', bound=type[Any])
 
@@ -67,7 +79,8 @@ class RequestDecorator(Protocol):
 class DecoratorFactory(Protocol):
     def __call__(
         self, route: str, *, version: int = 1, use_api: bool = True,
-        json: bool = True, xml: bool = False, **g_kwargs: Any
+        json: bool = True, xml: bool = False, cache: APICache = None,
+        **g_kwargs: Any
     ) -> RequestDecorator: ...
 
 
@@ -95,7 +108,46 @@ class APINoURLError(APIClientError):
 
 # Tiny API Client
 
-@dataclass
+_formatter = string.Formatter()
+_MISSING = object()
+
+
+class _CappedRetry(Retry):
+    """Retry which gives up when the server asks for a long wait"""
+    # Longest Retry-After wait followed, in seconds
+    RETRY_AFTER_MAX = 2
+
+    def increment(self, method: str | None = None, url: str | None = None,
+                  response: BaseHTTPResponse | None = None,
+                  error: Exception | None = None,
+                  _pool: ConnectionPool | None = None,
+                  _stacktrace: TracebackType | None = None) -> Self:
+        if (response is not None
+                and response.status in self.RETRY_AFTER_STATUS_CODES):
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > self.RETRY_AFTER_MAX:
+                # Hand the response back instead of retrying too early
+                reason = ResponseError(
+                    f"Retry-After of {retry_after}s exceeds the limit")
+                raise MaxRetryError(
+                    _pool, url, reason)  # type: ignore[arg-type]
+        return super().increment(method, url, response, error,
+                                 _pool, _stacktrace)
+
+
+# Back off and retry idempotent requests on rate limits and server errors,
+# waiting a few seconds at most before giving up
+_DEFAULT_RETRY = _CappedRetry(
+    total=3,
+    backoff_factor=0.25,
+    backoff_max=2,
+    status_forcelist=(429, 500, 502, 503, 504),
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+
+
+@dataclass(slots=True)
 class Endpoint:
     route: str
     version: int
@@ -103,85 +155,170 @@ class Endpoint:
     json: bool
     xml: bool
     kwargs: dict[str, Any]
+    cache: APICache = None
+    params: tuple[str, ...] = field(init=False)
+    segments: tuple[tuple[str, str | None, str, str | None], ...] = field(
+        init=False)
+    bare_route: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        # Route parameters are parsed once, when the endpoint is declared
+        self.segments = tuple((literal, name, spec or '', conversion) for
+                              literal, name, spec, conversion
+                              in _formatter.parse(self.route))
+        self.params = tuple(x[1] for x in self.segments if x[1] is not None)
+        # Route as called when no parameters are given
+        self.bare_route = ''.join(x[0] for x in self.segments)
+
+
+@dataclass(frozen=True, slots=True)
+class _APIConfig:
+    """Class wide settings given to the api_client decorator"""
+    timeout: int | None
+    max_retries: int | Retry
+    pool_connections: int
+    pool_maxsize: int
+    pool_block: bool
+    status_handler: APIStatusHandler
+    status_key: str
+    results_key: str
+    json_loader: JSONLoader
+    xml_loader: XMLLoader
+
+
+def _format_endpoint(url: str, endpoint: Endpoint,
+                     kwargs: dict[str, Any]) -> str:
+    """Build final endpoint URL for an API call.
+
+    Positional endpoint arguments are removed from kwargs on the way,
+    leaving only the additional arguments to pass to `requests`.
+    """
+    parts = []
+    if endpoint.use_api:
+        if '{' in url:
+            url = url.format(version=endpoint.version)
+        parts.append(url)
+
+    if not endpoint.params:
+        parts.append(endpoint.bare_route)
+    else:
+        positional_args = {}
+        for literal, name, spec, conversion in endpoint.segments:
+            parts.append(literal)
+            if name is not None:
+                if name in kwargs:
+                    positional_args[name] = kwargs.pop(name)
+                value = positional_args.get(name, '')
+                if conversion is not None:
+                    # Apply !r, !s or !a as str.format would
+                    value = _formatter.convert_field(value, conversion)
+                parts.append(format(value, spec))
+    return ''.join(parts).rstrip('/')
+
+
+def _create_adapter(config: _APIConfig) -> Any:
+    """Create the connection pool shared by all instances of a client."""
+    return requests.adapters.HTTPAdapter(
+        pool_connections=config.pool_connections,
+        pool_maxsize=config.pool_maxsize,
+        pool_block=config.pool_block,
+        max_retries=config.max_retries
+    )
 
 
-def _format_endpoint(url: str, endpoint: str, use_api: bool,
-                     positional_args: dict[str, Any]) -> str:
-    """Build final endpoint URL for an API call."""
-    param_map = defaultdict(lambda: '', positional_args)
-    route_params = endpoint.format_map(param_map)
-    endpoint_url = f"{url}{route_params}" if use_api else route_params
-    return endpoint_url.rstrip('/')
+def _create_session(client: Any, adapter: Any) -> Any:
+    """Create a session to reuse connections across API calls.
 
+    Each instance has its own session, and therefore its own cookies,
+    but the underlying connections are shared through the adapter.
 
-def _pop_api_kwargs(endpoint: str, kwargs: dict[str, Any]) -> dict[str, Any]:
-    """Remove positional endpoint arguments from kwargs before passing
-    additional arguments to `requests`.
+    :returns: The bound `request` method of the new session
     """
-    formatter = string.Formatter()
-    for x in formatter.parse(endpoint):
-        if x[1] is not None:
-            kwargs.pop(x[1], None)
-    return kwargs
+    _logger.info("Creating new requests session")
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    client.__client_session = session
+    client.__client_request = session.request
+    client.__client_lock = threading.Lock()
+    return client.__client_request
 
 
 def _make_request(client: Any, method: str, endpoint: str,
-                  **kwargs: Any) -> Any:
+                  timeout: int | None, /, **kwargs: Any) -> Any:
     """Use `requests` to send out a request to the API endpoint."""
-    if not hasattr(client, '__client_session'):
-        # Create a session to reuse connections
-        _logger.info("Creating new requests session")
-        client.__client_session = requests.Session()
+    try:
+        request = client.__client_request
+    except AttributeError:
+        # Subclass did not call the decorated __init__
+        request = _create_session(client, client.__api_adapter)
 
     # The following assertion causes issues in testing
     # since MagicMock is not an instance of Session
     # Thus, the return type has to be Any for now
     # assert isinstance(client.__client_session, requests.Session)
 
-    _logger.debug(f"Making request to {endpoint}")
+    _logger.debug("Making request to %s", endpoint)
 
-    cookies = None
-    if hasattr(client, '_cookies'):
-        cookies = client._cookies
-    elif hasattr(client, '_session'):
-        _logger.warning("_session is deprecated.")
-        cookies = client._session
+    cookies = getattr(client, '_cookies', None)
+    if cookies is None:
+        cookies = getattr(client, '_session', None)
+        # Deprecated, only warn on the first request of each client class
+        if cookies is not None and not client.__api_session_warned:
+            type(client).__api_session_warned = True
+            _logger.warning("_session is deprecated.")
 
-    return client.__client_session.request(
-        method, endpoint,
-        timeout=client.__api_timeout,
-        cookies=cookies, **kwargs
-    )
+    # Sessions are not thread-safe, so the requests of an instance
+    # (e.g. concurrent async calls) are sent one at a time
+    with client.__client_lock:
+        return request(
+            method, endpoint,
+            timeout=timeout,
+            cookies=cookies, **kwargs
+        )
 
 
-def _handle_response(response: Any,
-                     json: bool, xml: bool,
-                     status_key: str, results_key: str,
-                     status_handler: _StatusHandler) -> Any:
-    """Parse json or XML response after request is complete"""
+def _handle_response(client: Any, response: Any, json: bool, xml: bool,
+                     config: _APIConfig) -> tuple[Any, bool]:
+    """Parse json or XML response after request is complete
+
+    :returns: The parsed response, and whether it had a status code
+    """
     endpoint_response: Any = response
+    has_status = False
 
     if json:
-        endpoint_response = response.json()
+        if config.json_loader is not None:
+            endpoint_response = config.json_loader(response.content)
+        else:
+            endpoint_response = response.json()
 
         if not endpoint_response:
             raise APIEmptyResponseError()
 
-        if status_key in endpoint_response:
-            status_code = endpoint_response[status_key]
-            _logger.warning(f"Code {status_code} from {response.url}")
-
-            if status_handler is not None:
-                status_handler(status_code, endpoint_response)
-            else:
-                raise APIStatusError('Server responded with an error code')
-
-        if results_key in endpoint_response:
-            endpoint_response = endpoint_response[results_key]
+        if isinstance(endpoint_response, dict):
+            status_code = endpoint_response.get(config.status_key, _MISSING)
+            if status_code is not _MISSING:
+                has_status = True
+                _logger.warning("Code %s from %s", status_code, response.url)
+
+                if config.status_handler is not None:
+                    config.status_handler(client, status_code,
+                                          endpoint_response)
+                else:
+                    raise APIStatusError(
+                        'Server responded with an error code')
+
+            endpoint_response = endpoint_response.get(config.results_key,
+                                                      endpoint_response)
     elif xml:
-        endpoint_response = ElementTree.fromstring(response.text)
+        if config.xml_loader is not None:
+            endpoint_response = config.xml_loader(response.content)
+        else:
+            endpoint_response = ElementTree.fromstring(response.content)
 
-    return endpoint_response
+    return endpoint_response, has_status
 
 
 def make_api_call(method: str, client: Any,
@@ -190,23 +327,39 @@ def make_api_call(method: str, client: Any,
     if client._url is None:
         raise APINoURLError()
 
-    # Build final API endpoint URL
-    url = client._url.format(version=endpoint.version)
-    route = _format_endpoint(url, endpoint.route, endpoint.use_api, kwargs)
-
-    # Remove parameters meant for endpoint formatting
-    kwargs = _pop_api_kwargs(endpoint.route, kwargs)
-
-    response = _make_request(client, method, route,
-                             **kwargs, **endpoint.kwargs)
-    endpoint_response = _handle_response(
+    # Build final API endpoint URL, consuming its parameters
+    route = _format_endpoint(client._url, endpoint, kwargs)
+
+    # Only responses to GET requests may be cached
+    cache = endpoint.cache if method == 'GET' else None
+    if cache is not None:
+        # Endpoints sharing a cache may parse the same URL differently
+        cache_key = (id(endpoint), route, tuple(sorted(kwargs.items())))
+        try:
+            return cache[cache_key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable requests arguments
+            cache = None
+
+    config = client.__api_config
+    if endpoint.kwargs:
+        response = _make_request(client, method, route, config.timeout,
+                                 **kwargs, **endpoint.kwargs)
+    else:
+        response = _make_request(client, method, route, config.timeout,
+                                 **kwargs)
+    endpoint_response, has_status = _handle_response(
+        client,
         response,
         endpoint.json,
         endpoint.xml,
-        client.__api_status_key,
-        client.__api_results_key,
-        client.__api_status_handler)
+        config)
 
+    # Errors are not cached, even if the status handler let them through
+    if cache is not None and response.ok and not has_status:
+        cache[cache_key] = endpoint_response
     return endpoint_response
 
 
@@ -229,7 +382,7 @@ def api_client_method(method: str) -> DecoratorFactory:
     """
 
     def request(route: str, *, version: int = 1, use_api: bool = True,
-                json: bool = True, xml: bool = False,
+                json: bool = True, xml: bool = False, cache: APICache = None,
                 **request_kwargs: Any) -> RequestDecorator:
         """Declare an endpoint with the given HTTP method and parameters
 
@@ -246,9 +399,11 @@ def api_client_method(method: str) -> DecoratorFactory:
         :param int version: Replaces version placeholder in API URL
         :param bool json: Toggle JSON parsing of response
         :param bool xml: Toggle XML parsing of response
+        :param MutableMapping cache: Store GET responses by URL and arguments
         :param dict request_kwargs: Any keyword arguments passed to requests
         """
-        endpoint = Endpoint(route, version, use_api, json, xml, request_kwargs)
+        endpoint = Endpoint(route, version, use_api, json, xml,
+                            request_kwargs, cache)
 
         def request_decorator(func: Callable[Concatenate[Any, Any, P], T]
                               ) -> Callable[Concatenate[Any, P], T]:
@@ -257,6 +412,24 @@ def api_client_method(method: str) -> DecoratorFactory:
             :param function func: Function to decorate
             """
 
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_request_wrapper(
+                    self: Any, /, *args: P.args, **kwargs: P.kwargs
+                ) -> Any:
+                    """Call API endpoint in a worker thread, then await
+                    user-defined API endpoint handler.
+
+                    :param list args: Passed to the function being wrapped
+                    :param dict kwargs: Any kwargs are passed to requests
+                    """
+                    response = await asyncio.to_thread(
+                        make_api_call, method, self, endpoint, **kwargs)
+                    return await cast(Awaitable[Any],
+                                      func(self, response, *args))
+                return cast(Callable[Concatenate[Any, P], T],
+                            async_request_wrapper)
+
             @wraps(func)
             def request_wrapper(self: Any, /,
                                 *args: P.args, **kwargs: P.kwargs) -> T:
@@ -275,8 +448,13 @@ def api_client_method(method: str) -> DecoratorFactory:
 
 def api_client(url: str | None = None, /, *,
                timeout: int | None = None,
+               max_retries: int | Retry = _DEFAULT_RETRY,
+               pool_connections: int = 10, pool_maxsize: int = 20,
+               pool_block: bool = False,
                status_handler: APIStatusHandler = None,
-               status_key: str = 'status', results_key: str = 'results'
+               status_key: str = 'status', results_key: str = 'results',
+               json_loader: JSONLoader = None,
+               xml_loader: XMLLoader = None
                ) -> Callable[[APIClient], APIClient]:
     """Annotate a class to use the api client method decorators
 
@@ -287,22 +465,91 @@ def api_client(url: str | None = None, /, *,
 
     :param str url: The root URL of the API server
     :param int timeout: Timeout for requests in seconds
+    :param max_retries: Number of retries, or a urllib3 `Retry` instance
+    :param int pool_connections: Number of host connection pools to cache
+    :param int pool_maxsize: Maximum connections kept open per host
+    :param bool pool_block: Wait for a free connection instead of
+        opening one that will not be kept in the pool
     :param Callable status_handler: Error handler for status codes
     :param str status_key: Key of response that contains status codes
     :param str results_key: Key of response that contains results
+    :param Callable json_loader: Parses raw JSON response bodies
+    :param Callable xml_loader: Parses raw XML response bodies
     """
 
     def wrap(cls: APIClient) -> APIClient:
         cls._url = url
-        cls.__api_timeout = timeout
-        cls.__api_status_handler = status_handler
-        cls.__api_status_key = status_key
-        cls.__api_results_key = results_key
+        config = _APIConfig(timeout, max_retries,
+                            pool_connections, pool_maxsize, pool_block,
+                            status_handler, status_key, results_key,
+                            json_loader, xml_loader)
+        cls.__api_config = config
+        adapter = cls.__api_adapter = _create_adapter(config)
+        cls.__api_session_warned = False
+
+        cls_init = cls.__init__
+
+        @wraps(cls_init)
+        def __init__(self: Any, *args: Any, **kwargs: Any) -> None:
+            # Session must exist before the original __init__ runs,
+            # which may already call some endpoint (e.g. to log in)
+            if not hasattr(self, '__client_session'):
+                _create_session(self, adapter)
+            cls_init(self, *args, **kwargs)
+
+        cls.__init__ = __init__
         return cls
 
     return wrap
 
 
+@overload
+async def gather_many(calls: Iterable[Awaitable[T]], /, *,
+                      concurrency: int = ...,
+                      return_exceptions: Literal[False] = ...) -> list[T]: ...
+
+
+@overload
+async def gather_many(calls: Iterable[Awaitable[T]], /, *,
+                      concurrency: int = ...,
+                      return_exceptions: bool) -> list[T | BaseException]: ...
+
+
+async def gather_many(calls: Iterable[Awaitable[T]], /, *,
+                      concurrency: int = 4,
+                      return_exceptions: bool = False
+                      ) -> list[T] | list[T | BaseException]:
+    """Await many asynchronous endpoint calls, a few at a time
+
+    Requests are sent from the default thread pool of the event loop,
+    so no more than its number of workers can be in flight at once.
+    Calls on the same client instance are sent one at a time, so use
+    separate instances to run them in parallel.
+
+    Basic usage:
+        >>> await gather_many(
+        ...     MyClient().fetch_profile(user_id=user_id) for user_id in users
+        ... )
+
+    :param Iterable calls: Awaitables returned by async endpoints
+    :param int concurrency: Maximum number of calls in flight
+    :param bool return_exceptions: Return errors instead of raising them
+    :returns: The results of every call, in order
+    :raises ValueError: If concurrency is lower than one
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(call: Awaitable[T]) -> T:
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*map(limited, calls),
+                                return_exceptions=return_exceptions)
+
+
 get = api_client_method('GET')
 post = api_client_method('POST')
 put = api_client_method('PUT')
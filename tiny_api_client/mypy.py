@@ -22,7 +22,7 @@ Please activate in your mypy configuration file.
 # 02110-1301  USA
 
 import string
-from typing import NamedTuple
+from functools import lru_cache
 from collections.abc import Callable, Iterable
 
 from mypy.nodes import ARG_NAMED, ARG_NAMED_OPT, StrExpr
@@ -34,28 +34,23 @@ from mypy.types import Type, CallableType
 class RouteParser:
     formatter = string.Formatter()
 
-    class FormatTuple(NamedTuple):
-        literal_text: str | None
-        field_name: str | None
-        format_spec: str | None
-        conversion: str | None
-
     def __init__(self, route: str):
-        parsed = self.formatter.parse(route)
-        self.params = []
+        # (literal_text, field_name, format_spec, conversion)
+        self.params = list(self.formatter.parse(route))
 
-        for t in parsed:
-            self.params.append(self.FormatTuple(*t))
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def for_route(cls, route: str) -> 'RouteParser':
+        """Get a parser for the route, reusing one for identical routes."""
+        return cls(route)
 
     @property
     def fields(self) -> Iterable[str]:
-        return (x.field_name for x in self.params if x.field_name is not None)
+        return (x[1] for x in self.params if x[1] is not None)
 
     @property
     def has_optional(self) -> bool:
-        if not len(self.params):
-            return False
-        return self.params[-1].field_name is not None
+        return bool(self.params) and self.params[-1][1] is not None
 
 
 class TinyAPIClientPlugin(Plugin):
@@ -70,7 +65,7 @@ class TinyAPIClientPlugin(Plugin):
     they were factual ones.
     """
     def __init__(self, options: Options) -> None:
-        self._ctx_cache: dict[str, RouteParser] = {}
+        self._ctx_cache: dict[tuple[int, int], RouteParser] = {}
         super().__init__(options)
 
     def get_method_hook(self, fullname: str
@@ -92,10 +87,10 @@ class TinyAPIClientPlugin(Plugin):
         to the returned decorator.
         """
         if len(ctx.args) and len(ctx.args[0]):
-            pos = f"{ctx.context.line},{ctx.context.column}"
+            pos = (ctx.context.line, ctx.context.column)
             route = ctx.args[0][0]
             assert isinstance(route, StrExpr)
-            self._ctx_cache[pos] = RouteParser(route.value)
+            self._ctx_cache[pos] = RouteParser.for_route(route.value)
         return ctx.default_return_type
 
     def _decorator_callback(self, ctx: MethodContext) -> Type:
@@ -105,7 +100,7 @@ class TinyAPIClientPlugin(Plugin):
         context, and they are included in the decorated function type
         as optional keyword-only parameters.
         """
-        pos = f"{ctx.context.line},{ctx.context.column}"
+        pos = (ctx.context.line, ctx.context.column)
         default_ret = ctx.default_return_type
         # need this to access properties without a warning
         assert isinstance(default_ret, CallableType)